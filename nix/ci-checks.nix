@@ -16,6 +16,7 @@
   pythonDeps = with python3Packages; [
     loguru
     httpx
+    orjson
     pandas
     seaborn
     pytest
@@ -70,7 +71,7 @@ in {
       {
         buildInputs = [python3Packages.pylint] ++ pythonDeps;
       } ''
-        find ${../.} -name '*.py' ! -name "3rdparty" | xargs pylint --ignored-modules "*_pb2"
+        find ${../.} -name '*.py' ! -name "3rdparty" | xargs pylint --ignored-modules "*_pb2" --extension-pkg-allow-list orjson
         mkdir $out
       '';
 
@@ -6,6 +6,7 @@ Governance helpers with instances of LSKV proposals.
 """
 
 
+import functools
 import json
 import subprocess
 import tempfile
@@ -14,6 +15,22 @@ from typing import Any, Dict, List, Optional
 
 from loguru import logger
 
+CONSTITUTION_FILES = [
+    "constitution/actions.js",
+    "constitution/apply.js",
+    "constitution/resolve.js",
+    "constitution/validate.js",
+]
+
+
+@functools.lru_cache(maxsize=16)
+def read_constitution_file(path: str) -> str:
+    """
+    Read a constitution file, caching the contents for repeated proposals.
+    """
+    with open(path, "r", encoding="utf-8") as const_file:
+        return const_file.read()
+
 
 class Proposal:
     """
@@ -33,10 +50,7 @@ class Proposal:
         """
         Set the constitution to the concatenation of the given files.
         """
-        constitution = []
-        for file in constitution_files:
-            with open(file, "r", encoding="utf-8") as const_file:
-                constitution.append(const_file.read())
+        constitution = [read_constitution_file(file) for file in constitution_files]
         action = {
             "name": "set_constitution",
             "args": {
@@ -220,14 +234,7 @@ def set_initial_constitution():
     https://github.com/microsoft/CCF/issues/4572
     """
     proposal = Proposal()
-    proposal.set_constitution(
-        [
-            "constitution/actions.js",
-            "constitution/apply.js",
-            "constitution/resolve.js",
-            "constitution/validate.js",
-        ]
-    )
+    proposal.set_constitution(CONSTITUTION_FILES)
     client = Client(
         "127.0.0.1:8000",
         "workspace/sandbox_common/service_cert.pem",
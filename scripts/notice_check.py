@@ -4,9 +4,11 @@
 Script to check that source files have license headers.
 """
 
+import fnmatch
+import os
 import subprocess
 import sys
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from loguru import logger
 
@@ -16,10 +18,10 @@ LICENSE_HEADER = (
     "Licensed under the MIT License."
 )
 
-COMMENT_PREFIXES = ["//", "#"]
+COMMENT_PREFIXES = ("//", "#")
 
 
-def extract_potential_license(lines: List[str]) -> str:
+def extract_potential_license(lines: Iterable[str]) -> str:
     """
     Extract the first lines of a file that start with a comment prefix.
 
@@ -27,14 +29,13 @@ def extract_potential_license(lines: List[str]) -> str:
     """
     license_lines: List[str] = []
     for line in lines:
-        was_comment = False
-        for comment_prefix in COMMENT_PREFIXES:
-            if line.startswith(comment_prefix):
-                line = line.lstrip(comment_prefix)
-                was_comment = True
-        if not was_comment:
+        if not line.startswith(COMMENT_PREFIXES):
             logger.debug("stopping at line: {}", line.strip())
             return " ".join(license_lines)
+        for comment_prefix in COMMENT_PREFIXES:
+            if line.startswith(comment_prefix):
+                line = line[len(comment_prefix) :]
+                break
         license_lines.append(line.strip())
 
     return " ".join(license_lines)
@@ -46,8 +47,8 @@ def has_notice(path: str) -> bool:
     """
     try:
         with open(path, "r", encoding="utf-8") as file:
-            lines = file.readlines()
-            license_lines = extract_potential_license(lines)
+            # only read as far as the leading comment block
+            license_lines = extract_potential_license(file)
             if LICENSE_HEADER in license_lines:
                 return True
             logger.debug("   found: {}", license_lines)
@@ -60,36 +61,133 @@ def has_notice(path: str) -> bool:
         return True
 
 
+EXCLUDED = [
+    "3rdparty/",  # these aren't ours
+    "LICENSE",  # don't need a license on the license
+    "*.json",  # can't add comments to these files
+    "*.ipynb",  # can't add comments to these files
+    "*.md",  # just documentation
+    ".gitmodules",  # not a source file
+    ".gitignore",  # not a source file
+    ".dockerignore",  # not a source file
+    ".clang-format",  # not a source file
+    "proto/etcd.proto",  # mostly not ours
+    "proto/status.proto",  # mostly not ours
+    ".github/workflows",  # not source files
+    "nix/",  # just build files
+    "flake.nix",  # just build files
+    "flake.lock",  # just build files
+    ".envrc",  # just build files
+    "*.parquet",  # binary
+    "benchmark/go-ycsb/workloads",
+]
+
+# directories that are never tracked so shouldn't be walked without git, on
+# top of anything matched by a .gitignore
+UNTRACKED_DIRS = {".git"}
+
+GITIGNORE = ".gitignore"
+
+
 def git_ls_files() -> List[str]:
     """
     Get the list of files to check that are tracked by git.
     """
-    excluded = [
-        "3rdparty/",  # these aren't ours
-        "LICENSE",  # don't need a license on the license
-        "*.json",  # can't add comments to these files
-        "*.ipynb",  # can't add comments to these files
-        "*.md",  # just documentation
-        ".gitmodules",  # not a source file
-        ".gitignore",  # not a source file
-        ".dockerignore",  # not a source file
-        ".clang-format",  # not a source file
-        "proto/etcd.proto",  # mostly not ours
-        "proto/status.proto",  # mostly not ours
-        ".github/workflows",  # not source files
-        "nix/",  # just build files
-        "flake.nix",  # just build files
-        "flake.lock",  # just build files
-        ".envrc",  # just build files
-        "*.parquet",  # binary
-        "benchmark/go-ycsb/workloads",
-    ]
-    excluded = [f":!:{e}" for e in excluded]
+    excluded = [f":!:{e}" for e in EXCLUDED]
     cmd = ["git", "ls-files", "--", "."] + excluded
     res = subprocess.run(cmd, check=True, capture_output=True)
     return res.stdout.decode("utf-8").strip().split("\n")
 
 
+def is_excluded(path: str) -> bool:
+    """
+    Check whether a relative path matches one of the exclusions.
+    """
+    for exclusion in EXCLUDED:
+        if "*" in exclusion:
+            if fnmatch.fnmatch(path, exclusion):
+                return True
+        else:
+            exclusion = exclusion.rstrip("/")
+            if path == exclusion or path.startswith(exclusion + "/"):
+                return True
+    return False
+
+
+def read_gitignore(directory: str) -> List[Tuple[str, str]]:
+    """
+    Read the patterns from a .gitignore in the given directory, if there is one.
+
+    Each pattern is paired with the directory it is relative to. Negated
+    patterns aren't supported and are skipped.
+    """
+    path = os.path.join(directory, GITIGNORE)
+    if not os.path.isfile(path):
+        return []
+    rules = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith(("#", "!")):
+                continue
+            rules.append((directory, line))
+    return rules
+
+
+def is_ignored(path: str, is_dir: bool, rules: List[Tuple[str, str]]) -> bool:
+    """
+    Check whether a relative path is matched by any of the gitignore rules.
+    """
+    for base, pattern in rules:
+        if pattern.endswith("/"):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip("/")
+        rel = os.path.relpath(path, base)
+        if rel.startswith(".."):
+            continue
+        if "/" in pattern:
+            # anchored to the directory of the .gitignore
+            if fnmatch.fnmatch(rel, pattern.lstrip("/")):
+                return True
+        elif fnmatch.fnmatch(os.path.basename(path), pattern):
+            return True
+    return False
+
+
+def fs_files(
+    root: str = ".", rules: Optional[List[Tuple[str, str]]] = None
+) -> Iterator[str]:
+    """
+    Walk the filesystem for files to check, for when git isn't available.
+
+    Excluded and gitignored directories are skipped entirely rather than
+    filtered afterwards, so this gives the tracked files along with any
+    untracked ones that aren't ignored.
+    """
+    rules = (rules or []) + read_gitignore(os.path.relpath(root, "."))
+    with os.scandir(root) as entries:
+        for entry in entries:
+            path = os.path.relpath(entry.path, ".")
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if is_excluded(path) or is_ignored(path, is_dir, rules):
+                continue
+            if is_dir:
+                if entry.name not in UNTRACKED_DIRS:
+                    yield from fs_files(entry.path, rules)
+            elif entry.is_file(follow_symlinks=False):
+                yield path
+
+
+def list_files() -> Iterable[str]:
+    """
+    Get the files to check, using git where possible.
+    """
+    if os.environ.get("NOTICE_CHECK_USE_FS") == "1" or not os.path.exists(".git"):
+        return fs_files()
+    return git_ls_files()
+
+
 def main():
     """
     Main function.
@@ -97,7 +195,7 @@ def main():
     logger.remove()
     logger.add(sink=sys.stdout, level="WARNING")
 
-    files = git_ls_files()
+    files = list_files()
 
     missing = 0
     for file in files:
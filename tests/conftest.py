@@ -0,0 +1,75 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Shared fixtures for the tests.
+
+These live here rather than being imported into each test module so that the
+session-scoped fixtures really are created once per session.
+"""
+
+import pytest
+
+# pylint: disable=no-name-in-module
+from test_common import HttpClient, Sandbox
+
+# pylint: disable=import-error
+from lskv import governance  # type: ignore
+
+
+@pytest.fixture(name="sandbox", scope="session")
+def fixture_sandbox():
+    """
+    Start the sandbox and wait to be ready.
+
+    This is shared by all tests in the session (or xdist worker) so tests
+    should use their own keys.
+    """
+    sandbox = Sandbox(http2=False)
+    with sandbox:
+        ready = sandbox.wait_for_ready()
+        if ready:
+            yield sandbox
+        else:
+            raise RuntimeError("failed to prepare the sandbox")
+
+
+@pytest.fixture(name="constitution", scope="session", autouse=True)
+def fixture_constitution(sandbox):
+    """
+    Set up the lskv constitution on the sandbox, once per session.
+
+    This is needed since the ccf sandbox doesn't take a set of constitution files yet.
+    """
+    gov_client = sandbox.governance_client()
+    proposal = governance.Proposal()
+    proposal.set_constitution(governance.CONSTITUTION_FILES)
+    res = gov_client.propose(proposal)
+    if res.state != "Accepted":
+        gov_client.accept(res.proposal_id)
+
+
+@pytest.fixture(name="http1_client", scope="session")
+def fixture_http1_client(sandbox):
+    """
+    Make a http1 client for the sandbox.
+    """
+    with sandbox.http_client() as client:
+        yield HttpClient(client)
+
+
+@pytest.fixture(name="http1_client_unauthenticated", scope="session")
+def fixture_http1_client_unauthenticated(sandbox):
+    """
+    Make an unauthenticated http1 client for the sandbox.
+    """
+    with sandbox.http_client(authenticated=False) as client:
+        yield HttpClient(client)
+
+
+@pytest.fixture(name="governance_client", scope="session")
+def fixture_governance_client(sandbox):
+    """
+    Make a governance client for the sandbox.
+    """
+    return sandbox.governance_client()
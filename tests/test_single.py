@@ -11,22 +11,23 @@ from http import HTTPStatus
 
 # pylint: disable=import-error
 import ccf.ledger  # type: ignore
-from loguru import logger
+import pytest
 
-# pylint: disable=unused-import
 # pylint: disable=no-name-in-module
-from test_common import (
-    b64decode,
-    b64encode,
-    fixture_governance_client,
-    fixture_http1_client,
-    fixture_http1_client_unauthenticated,
-    fixture_sandbox,
-)
+from test_common import b64encode, extract_rev_term, put_op, range_op
 
 # pylint: disable=import-error
 from lskv import governance  # type: ignore
 
+# encoded forms of the fixed keys and values, compared against responses as is
+FOO_B64 = b64encode("foo")
+BAR_B64 = b64encode("bar")
+FOOH_B64 = b64encode("fooh")
+FOOH_VALUES_B64 = [b64encode(f"bar{i}") for i in range(5)]
+RANGE_LIMIT1_B64 = b64encode("range_limit1")
+
+VERSION_RE = re.compile(r"^\d+\.\d+\.\d+(-.*)?$")
+
 
 # pylint: disable=redefined-outer-name
 def test_starts(http1_client):
@@ -38,15 +39,14 @@ def test_starts(http1_client):
 
 
 # pylint: disable=redefined-outer-name
-def test_unauthenticated(http1_client_unauthenticated):
+@pytest.mark.parametrize(
+    "method,args", [("put", ("foo", "bar")), ("get", ("foo",)), ("delete", ("foo",))]
+)
+def test_unauthenticated(http1_client_unauthenticated, method, args):
     """
     Test that the unauthenticated users can't interact.
     """
-    res = http1_client_unauthenticated.put("foo", "bar", check=False)
-    assert res.status_code == HTTPStatus.UNAUTHORIZED
-    res = http1_client_unauthenticated.get("foo", check=False)
-    assert res.status_code == HTTPStatus.UNAUTHORIZED
-    res = http1_client_unauthenticated.delete("foo", check=False)
+    res = getattr(http1_client_unauthenticated, method)(*args, check=False)
     assert res.status_code == HTTPStatus.UNAUTHORIZED
 
 
@@ -60,8 +60,8 @@ def test_kv_latest(http1_client):
 
     res = http1_client.get("foo")
     kvs = res.json()["kvs"]
-    assert b64decode(kvs[0]["key"]) == "foo"
-    assert b64decode(kvs[0]["value"]) == "bar"
+    assert kvs[0]["key"] == FOO_B64
+    assert kvs[0]["value"] == BAR_B64
     assert kvs[0]["createRevision"] == str(put_rev)
     assert kvs[0]["modRevision"] == str(put_rev)
     assert kvs[0]["version"] == "1"
@@ -72,18 +72,15 @@ def test_kv_latest(http1_client):
 
     res = http1_client.get("foo")
     kvs = res.json()["kvs"]
-    assert b64decode(kvs[0]["key"]) == "foo"
-    assert b64decode(kvs[0]["value"]) == "bar"
+    assert kvs[0]["key"] == FOO_B64
+    assert kvs[0]["value"] == BAR_B64
     assert kvs[0]["createRevision"] == str(put_rev)
     assert kvs[0]["modRevision"] == str(update_rev)
     assert kvs[0]["version"] == "2"
 
-    # then we can delete it
+    # then we can delete it, the response saying how many keys went
     res = http1_client.delete("foo")
-
-    # and not see it any more
-    res = http1_client.get("foo")
-    assert "kvs" not in res.json()
+    assert res.json()["deleted"] == "1"
 
     # then create it again and it should have a new version and create_revision
     res = http1_client.put("foo", "bar")
@@ -91,8 +88,8 @@ def test_kv_latest(http1_client):
 
     res = http1_client.get("foo")
     kvs = res.json()["kvs"]
-    assert b64decode(kvs[0]["key"]) == "foo"
-    assert b64decode(kvs[0]["value"]) == "bar"
+    assert kvs[0]["key"] == FOO_B64
+    assert kvs[0]["value"] == BAR_B64
     assert kvs[0]["createRevision"] == str(put_rev)
     assert kvs[0]["modRevision"] == str(put_rev)
     assert kvs[0]["version"] == "1"
@@ -103,44 +100,56 @@ def test_kv_historical(http1_client):
     """
     Test that historical queries work.
     """
-    revisions = []
-    for i in range(5):
-        res = http1_client.put("fooh", f"bar{i}")
-        rev = int(res.json()["header"]["revision"])
-        term = int(res.json()["header"]["raftTerm"])
-        revisions.append((rev, term))
+    revisions = [
+        extract_rev_term(http1_client.put("fooh", f"bar{i}")) for i in range(5)
+    ]
 
     # should probably wait for commit to do this
     rev, term = revisions[-1]
     http1_client.wait_for_commit(term, rev)
 
+    # read every historical revision in a single txn
+    historical_ops = [range_op("fooh", rev=rev) for rev, _ in revisions]
+
     create_rev = revisions[0][0]
+    res = http1_client.txn(historical_ops)
+    responses = res.json()["responses"]
     for i, (rev, term) in enumerate(revisions):
-        res = http1_client.get("fooh", rev=rev)
-        kvs = res.json()["kvs"]
-        assert b64decode(kvs[0]["key"]) == "fooh"
-        assert b64decode(kvs[0]["value"]) == f"bar{i}"
+        kvs = responses[i]["responseRange"]["kvs"]
+        assert kvs[0]["key"] == FOOH_B64
+        assert kvs[0]["value"] == FOOH_VALUES_B64[i]
         assert kvs[0]["createRevision"] == str(create_rev)
         assert kvs[0]["modRevision"] == str(rev)
         assert kvs[0]["version"] == str(i + 1)
 
     res = http1_client.delete("fooh")
-    deleted_rev = int(res.json()["header"]["revision"])
+    deleted_rev, _ = extract_rev_term(res)
 
+    res = http1_client.txn(historical_ops)
+    responses = res.json()["responses"]
     for i, (rev, term) in enumerate(revisions):
         # still there
-        res = http1_client.get("fooh", rev=rev)
-        kvs = res.json()["kvs"]
-        assert b64decode(kvs[0]["key"]) == "fooh"
-        assert b64decode(kvs[0]["value"]) == f"bar{i}"
+        kvs = responses[i]["responseRange"]["kvs"]
+        assert kvs[0]["key"] == FOOH_B64
+        assert kvs[0]["value"] == FOOH_VALUES_B64[i]
         assert kvs[0]["createRevision"] == str(create_rev)
         assert kvs[0]["modRevision"] == str(rev)
         assert kvs[0]["version"] == str(i + 1)
 
+    # the range endpoint serves the same history, not just txns
+    res = http1_client.get("fooh", rev=create_rev)
+    kvs = res.json()["kvs"]
+    assert kvs[0]["key"] == FOOH_B64
+    assert kvs[0]["value"] == FOOH_VALUES_B64[0]
+    assert kvs[0]["createRevision"] == str(create_rev)
+    assert kvs[0]["modRevision"] == str(create_rev)
+    assert kvs[0]["version"] == "1"
+
     # but we can't see it in the historical keyspace anymore
     res = http1_client.get("fooh", rev=deleted_rev)
-    assert "kvs" not in res.json()  # fields with default values are not included
-    assert "count" not in res.json()  # fields with default values are not included
+    body = res.json()
+    assert "kvs" not in body  # fields with default values are not included
+    assert "count" not in body  # fields with default values are not included
 
 
 # pylint: disable=redefined-outer-name
@@ -148,13 +157,9 @@ def test_kv_compaction(http1_client):
     """
     Test that compacted entries aren't accessible.
     """
-    revisions = []
-    for i in range(5):
-        res = http1_client.put("foocompact", f"bar{i}")
-        hdr = res.json()["header"]
-        rev = int(hdr["revision"])
-        term = int(hdr["raftTerm"])
-        revisions.append((rev, term))
+    revisions = [
+        extract_rev_term(http1_client.put("foocompact", f"bar{i}")) for i in range(5)
+    ]
 
     rev, term = revisions[-1]
     http1_client.wait_for_commit(term, rev)
@@ -162,14 +167,22 @@ def test_kv_compaction(http1_client):
     # remove earlier items
     res = http1_client.compact(revisions[2][0])
 
-    # check that we can't access all of them
-    for i in range(5):
-        res = http1_client.get("foocompact", rev=revisions[i][0])
-        success = revisions[i][0] >= revisions[2][0]
+    # check that we can't access all of them, reading every revision in one txn
+    res = http1_client.txn([range_op("foocompact", rev=rev) for rev, _ in revisions])
+    responses = res.json()["responses"]
+    for i, (rev, _) in enumerate(revisions):
+        range_res = responses[i]["responseRange"]
+        success = rev >= revisions[2][0]
         if success:
-            assert int(res.json()["count"]) == 1
+            assert int(range_res["count"]) == 1
         else:
-            assert "count" not in res.json()
+            assert "count" not in range_res
+
+    # and the range endpoint agrees on either side of the compaction
+    res = http1_client.get("foocompact", rev=revisions[1][0])
+    assert "count" not in res.json()
+    res = http1_client.get("foocompact", rev=revisions[2][0])
+    assert int(res.json()["count"]) == 1
 
 
 def test_status_version(http1_client):
@@ -178,8 +191,7 @@ def test_status_version(http1_client):
     """
     res = http1_client.status()
     version = res.json()["version"]
-    version_re = r"^\d+\.\d+\.\d+(-.*)?$"
-    assert re.match(version_re, version)
+    assert VERSION_RE.match(version)
 
 
 # pylint: disable=redefined-outer-name
@@ -224,8 +236,7 @@ def test_lease(http1_client):
 
     # but we can't keep a revoked lease alive
     res, proto = http1_client.lease_keep_alive(lease_id, check=False)
-    logger.info("res: {} {}", res.status_code, res.text)
-    assert res.status_code == 400
+    assert res.status_code == HTTPStatus.BAD_REQUEST, res.text
 
     # and we can't revoke lease that wasn't active (or known)
     missing_id = "002"
@@ -261,18 +272,12 @@ def test_public_prefix(governance_client, http1_client, sandbox):
     Test the constitution action for public prefixes.
     """
     prefix = "mysecretprefix"
-    res = http1_client.put(f"{prefix}/test", "my secret")
-    term = int(res.json()["header"]["raftTerm"])
-    rev = int(res.json()["header"]["revision"])
-    http1_client.wait_for_commit(term, rev)
+    # revisions written along with how many public tables they should have
+    expected_tables = []
 
-    ledger = ccf.ledger.Ledger(
-        [os.path.join(sandbox.workspace(), "sandbox_0", "0.ledger")],
-        committed_only=False,
-    )
-    txn = ledger.get_transaction(rev)
-    public_domain = txn.get_public_domain()
-    assert len(public_domain.get_tables()) == 0
+    res = http1_client.put(f"{prefix}/test", "my secret")
+    rev, _ = extract_rev_term(res)
+    expected_tables.append((rev, 0))
 
     # set a secret prefix
     proposal = governance.Proposal()
@@ -282,17 +287,8 @@ def test_public_prefix(governance_client, http1_client, sandbox):
     governance_client.accept(proposal_id)
 
     res = http1_client.put(f"{prefix}/test", "my secret")
-    term = int(res.json()["header"]["raftTerm"])
-    rev = int(res.json()["header"]["revision"])
-    http1_client.wait_for_commit(term, rev)
-
-    ledger = ccf.ledger.Ledger(
-        [os.path.join(sandbox.workspace(), "sandbox_0", "0.ledger")],
-        committed_only=False,
-    )
-    txn = ledger.get_transaction(rev)
-    public_domain = txn.get_public_domain()
-    assert len(public_domain.get_tables()) == 1
+    rev, _ = extract_rev_term(res)
+    expected_tables.append((rev, 1))
 
     # removing an existing prefix is ok
     proposal = governance.Proposal()
@@ -303,30 +299,40 @@ def test_public_prefix(governance_client, http1_client, sandbox):
 
     # setting a new key now doesn't end up public
     res = http1_client.put(f"{prefix}/test", "my secret")
-    term = int(res.json()["header"]["raftTerm"])
-    rev = int(res.json()["header"]["revision"])
-    http1_client.wait_for_commit(term, rev)
+    rev, _ = extract_rev_term(res)
+    expected_tables.append((rev, 0))
+
+    check_public_tables(sandbox, expected_tables)
 
+
+def check_public_tables(sandbox, expected_tables):
+    """
+    Check the number of public tables written at each revision.
+
+    The ledger is read once for all of the revisions.
+    """
     ledger = ccf.ledger.Ledger(
         [os.path.join(sandbox.workspace(), "sandbox_0", "0.ledger")],
         committed_only=False,
     )
-    txn = ledger.get_transaction(rev)
-    public_domain = txn.get_public_domain()
-    assert len(public_domain.get_tables()) == 0
+    for rev, tables in expected_tables:
+        public_domain = ledger.get_transaction(rev).get_public_domain()
+        assert len(public_domain.get_tables()) == tables
 
 
 def test_range_limit(http1_client):
     """
     Test the limit arg on range queries.
     """
-    http1_client.put("range_limit1", "val")
-    http1_client.put("range_limit2", "val")
+    # the keys are distinct so can be written in one txn
+    http1_client.txn([put_op("range_limit1", "val"), put_op("range_limit2", "val")])
     res = http1_client.get("range_limit", range_end="range_limit4")
-    assert len(res.json()["kvs"]) == 2
-    assert res.json()["count"] == "2"
+    body = res.json()
+    assert len(body["kvs"]) == 2
+    assert body["count"] == "2"
 
     res = http1_client.get("range_limit", range_end="range_limit4", limit=1)
-    assert len(res.json()["kvs"]) == 1
-    assert res.json()["count"] == "1"
-    assert res.json()["kvs"][0]["key"] == b64encode("range_limit1")
+    body = res.json()
+    assert len(body["kvs"]) == 1
+    assert body["count"] == "1"
+    assert body["kvs"][0]["key"] == RANGE_LIMIT1_B64